@@ -1,15 +1,30 @@
-from flask import Flask, render_template, request, jsonify, flash, redirect, url_for, send_file
+from flask import (Flask, Response, abort, render_template, request, jsonify, flash, redirect, url_for,
+                   send_file, send_from_directory, session)
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from models import db, User, Medicine, Supplier, Sale, SaleItem, Prescription
+from models import db, User, Medicine, Supplier, Sale, SaleItem, Prescription, SalePartition
 from config import Config
-from datetime import datetime, timedelta
+from events import EventBroker
+from versioning import conditional, get_data_versions, seed_data_versions
+from fragments import FragmentCache
+from archive import (archivable_months, archive_month, daily_sales_totals, find_sale, reserve_archived_ids,
+                     restore_month, sales_in_range, sales_with_items, verify_month)
+from branches import BranchAggregator, branch_codes, is_branch, merge_counts, merge_rows
+from assets import ASSET_MAX_AGE, AssetBuilder, AssetManifest
+from invoices import (InvoiceCache, RenderPool, invoice_snapshot, parse_verification_payload,
+                      render_invoices, verification_code, write_invoices_zip)
+from datetime import datetime, time, timedelta
+import hmac
 import json
 import io
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-import qrcode
+import mimetypes
+import os
+import tempfile
+from time import perf_counter
+from types import SimpleNamespace
+import click
 import csv
 from io import StringIO
+from werkzeug.utils import safe_join
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -20,10 +35,131 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message_category = 'info'
 
+broker = EventBroker(queue_size=app.config['EVENT_QUEUE_SIZE'])
+asset_dist_dir = os.path.join(app.static_folder, 'dist')
+asset_manifest = AssetManifest(os.path.join(asset_dist_dir, 'manifest.json'))
+branch_aggregator = BranchAggregator()
+fragment_cache = FragmentCache(
+    max_entries=app.config['FRAGMENT_CACHE_MAX_ENTRIES'],
+    max_bytes=app.config['FRAGMENT_CACHE_MAX_BYTES'],
+    enabled=app.config['FRAGMENT_CACHE_ENABLED']
+)
+invoice_cache = InvoiceCache(app.config['INVOICE_CACHE_DIR'] or os.path.join(app.instance_path, 'invoice_cache'))
+invoice_pool = RenderPool(app.config['INVOICE_RENDER_WORKERS'])
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+# Static assets
+def asset_url(name):
+    """URL of the fingerprinted build of an asset, or its plain static file before a build"""
+    built = asset_manifest.lookup(name)
+    if built:
+        return url_for('asset', filename=built)
+    return url_for('static', filename=name)
+
+@app.context_processor
+def asset_helpers():
+    return {'asset_url': asset_url, 'assets_built': asset_manifest.loaded}
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    
+    # Prefer the precompressed variants written by `flask build-assets`
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        variant = safe_join(asset_dist_dir, filename + suffix)
+        if request.accept_encodings[encoding] and variant and os.path.isfile(variant):
+            response = send_from_directory(asset_dist_dir, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(asset_dist_dir, filename, mimetype=mimetype)
+    
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.cli.command('build-assets')
+@click.option('--tailwind-cli', help='Path to the tailwindcss v3 binary (default: $TAILWIND_CLI or PATH).')
+def build_assets_command(tailwind_cli):
+    """Build the purged CSS bundle and fingerprinted static assets.
+
+    The Vercel deploy has no build step, so static/dist is committed: rerun
+    this and commit static/dist whenever templates or assets change.
+    """
+    builder = AssetBuilder(app.root_path, asset_dist_dir, tailwind_cli)
+    try:
+        manifest = builder.build()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    for name, built in sorted(manifest.items()):
+        click.echo(f"{name} -> {built}")
+
+# Branch selection
+def current_branch():
+    """Branch whose shard serves this request: an admin's chosen branch, else the user's own"""
+    if not current_user.is_authenticated:
+        return app.config['DEFAULT_BRANCH']
+    if current_user.role == 'admin' and is_branch(session.get('branch')):
+        return session['branch']
+    if is_branch(current_user.branch):
+        return current_user.branch
+    return app.config['DEFAULT_BRANCH']
+
+@app.before_request
+def select_branch():
+    if request.endpoint in ('static', 'asset'):
+        return
+    db.session.info['branch'] = current_branch()
+
+@app.context_processor
+def branch_helpers():
+    return {'branches': branch_codes(), 'current_branch': db.session.info.get('branch')}
+
+@app.route('/branches/select', methods=['POST'])
+@login_required
+def select_branch_view():
+    if current_user.role != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('dashboard'))
+    
+    branch = request.form.get('branch')
+    if is_branch(branch):
+        session['branch'] = branch
+        flash(f'Switched to branch {branch}', 'success')
+    else:
+        flash('Unknown branch', 'danger')
+    return redirect(request.referrer or url_for('dashboard'))
+
+def use_branch(branch):
+    """Point CLI commands at one branch shard"""
+    branch = branch or app.config['DEFAULT_BRANCH']
+    if not is_branch(branch):
+        raise click.ClickException(f"Unknown branch {branch}")
+    db.session.info['branch'] = branch
+
+branch_option = click.option('--branch', help='Branch shard to work on (default: the default branch).')
+
+# Template fragment caching
+@app.template_global()
+def cached_fragment(name, *key, tables=(), vary_on_args=False, caller=None):
+    """Render a ``{% call %}`` block once per key and reuse the markup.
+
+    The key always includes the user's role, since ``can_access_module`` decides
+    which actions appear, and the branch. ``tables`` adds their data versions so
+    any write to them invalidates the fragment; ``vary_on_args`` adds the
+    request's filter/page parameters. Views pass the block's queries in
+    unexecuted (e.g. ``Medicine.query``) so they only run on a miss.
+    """
+    parts = [name, *key, current_user.role, db.session.info.get('branch')]
+    if tables:
+        parts.extend(zip(tables, get_data_versions(*tables)))
+    if vary_on_args:
+        parts.extend(sorted(request.args.items(multi=True)))
+    return fragment_cache.render(tuple(parts), caller)
+
 # Authentication Routes
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -53,19 +189,58 @@ def logout():
     logout_user()
     return redirect(url_for('login'))
 
+# Live feed events
+def is_low_stock(medicine):
+    return medicine.min_stock_level is not None and medicine.quantity <= medicine.min_stock_level
+
+def stock_event(medicine, was_low, total_delta=0):
+    """Build a stock change delta; call before commit so no refresh query is needed"""
+    low_stock = is_low_stock(medicine) and total_delta >= 0
+    return {
+        'medicine_id': medicine.id,
+        'name': medicine.name,
+        'quantity': medicine.quantity,
+        'min_stock_level': medicine.min_stock_level,
+        'low_stock': low_stock,
+        'low_stock_delta': int(low_stock) - int(was_low),
+        'total_delta': total_delta
+    }
+
+def sale_event(sale):
+    created_at = sale.created_at or datetime.utcnow()
+    return {
+        'sale_id': sale.id,
+        'invoice_number': sale.invoice_number,
+        'final_amount': float(sale.final_amount),
+        'created_at': created_at.isoformat(),
+        'is_today': created_at.date() == datetime.today().date()
+    }
+
 # Dashboard
-@app.route('/')
-@login_required
-def dashboard():
-    # Dashboard statistics
+def dashboard_stats():
+    # Range filters on created_at stay on the index of the hot sale table
+    today = datetime.combine(datetime.today().date(), time.min)
+    is_today = (Sale.created_at >= today) & (Sale.created_at < today + timedelta(days=1))
+    
     total_medicines = Medicine.query.count()
     low_stock_medicines = Medicine.query.filter(Medicine.quantity <= Medicine.min_stock_level).count()
-    total_sales_today = Sale.query.filter(
-        db.func.date(Sale.created_at) == datetime.today().date()
-    ).count()
+    total_sales_today = Sale.query.filter(is_today).count()
     total_revenue_today = db.session.query(
         db.func.sum(Sale.final_amount)
-    ).filter(db.func.date(Sale.created_at) == datetime.today().date()).scalar() or 0
+    ).filter(is_today).scalar() or 0
+    
+    return {
+        'total_medicines': total_medicines,
+        'low_stock_medicines': low_stock_medicines,
+        'total_sales_today': total_sales_today,
+        'total_revenue_today': float(total_revenue_today)
+    }
+
+@app.route('/')
+@login_required
+def dashboard():
+    # Dashboard statistics
+    stats = dashboard_stats()
     
     # Expiring medicines (within 30 days)
     expiring_medicines = Medicine.query.filter(
@@ -73,11 +248,24 @@ def dashboard():
     ).order_by(Medicine.expiry_date).limit(5).all()
     
     return render_template('dashboard.html',
-                         total_medicines=total_medicines,
-                         low_stock_medicines=low_stock_medicines,
-                         total_sales_today=total_sales_today,
-                         total_revenue_today=total_revenue_today,
-                         expiring_medicines=expiring_medicines)
+                         expiring_medicines=expiring_medicines,
+                         **stats)
+
+@app.route('/api/events/snapshot')
+@login_required
+def events_snapshot():
+    # Full counters, fetched once by live feed clients after a resync or reconnect
+    return jsonify(dashboard_stats())
+
+@app.route('/api/events/stream')
+@login_required
+def events_stream():
+    subscriber = broker.subscribe(channel=db.session.info.get('branch'))
+    return Response(
+        broker.stream(subscriber, heartbeat=app.config['EVENT_HEARTBEAT_SECONDS']),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 # Medicine Management
 @app.route('/medicines')
@@ -87,7 +275,7 @@ def medicines():
         flash('Access denied', 'danger')
         return redirect(url_for('dashboard'))
     
-    medicines_list = Medicine.query.all()
+    medicines_list = Medicine.query
     return render_template('medicines/index.html', medicines=medicines_list)
 
 @app.route('/medicines/add', methods=['GET', 'POST'])
@@ -114,7 +302,10 @@ def add_medicine():
                 is_prescription_required=bool(request.form.get('is_prescription_required'))
             )
             db.session.add(medicine)
+            db.session.flush()
+            event = stock_event(medicine, was_low=False, total_delta=1)
             db.session.commit()
+            broker.publish('stock', event, channel=db.session.info.get('branch'))
             flash('Medicine added successfully', 'success')
             return redirect(url_for('medicines'))
         except Exception as e:
@@ -135,6 +326,7 @@ def edit_medicine(medicine_id):
     
     if request.method == 'POST':
         try:
+            was_low = is_low_stock(medicine)
             medicine.name = request.form['name']
             medicine.generic_name = request.form.get('generic_name')
             medicine.category = request.form.get('category')
@@ -147,7 +339,9 @@ def edit_medicine(medicine_id):
             medicine.min_stock_level = int(request.form.get('min_stock_level', 10))
             medicine.is_prescription_required = bool(request.form.get('is_prescription_required'))
             
+            event = stock_event(medicine, was_low)
             db.session.commit()
+            broker.publish('stock', event, channel=db.session.info.get('branch'))
             flash('Medicine updated successfully', 'success')
             return redirect(url_for('medicines'))
         except Exception as e:
@@ -165,8 +359,10 @@ def delete_medicine(medicine_id):
     
     medicine = Medicine.query.get_or_404(medicine_id)
     try:
+        event = stock_event(medicine, is_low_stock(medicine), total_delta=-1)
         db.session.delete(medicine)
         db.session.commit()
+        broker.publish('stock', event, channel=db.session.info.get('branch'))
         flash('Medicine deleted successfully', 'success')
     except Exception as e:
         db.session.rollback()
@@ -221,7 +417,7 @@ def sales():
         flash('Access denied', 'danger')
         return redirect(url_for('dashboard'))
     
-    sales_list = Sale.query.order_by(Sale.created_at.desc()).all()
+    sales_list = Sale.query.options(db.selectinload(Sale.items)).order_by(Sale.created_at.desc())
     return render_template('sales/index.html', sales=sales_list)
 
 @app.route('/sales/new', methods=['GET', 'POST'])
@@ -251,10 +447,12 @@ def new_sale():
             db.session.add(sale)
             db.session.flush()  # Get sale ID
             
+            stock_events = []
             for item in sale_data['items']:
                 medicine = Medicine.query.get(item['medicine_id'])
                 if medicine.quantity < item['quantity']:
                     return jsonify({'success': False, 'message': f'Insufficient stock for {medicine.name}'})
+                was_low = is_low_stock(medicine)
                 
                 sale_item = SaleItem(
                     sale_id=sale.id,
@@ -267,8 +465,14 @@ def new_sale():
                 
                 # Update stock
                 medicine.quantity -= item['quantity']
+                stock_events.append(stock_event(medicine, was_low))
             
+            event = sale_event(sale)
             db.session.commit()
+            branch = db.session.info.get('branch')
+            broker.publish('sale', event, channel=branch)
+            for stock_change in stock_events:
+                broker.publish('stock', stock_change, channel=branch)
             return jsonify({'success': True, 'invoice_number': invoice_number, 'sale_id': sale.id})
         except Exception as e:
             db.session.rollback()
@@ -295,7 +499,7 @@ def prescriptions():
         flash('Access denied', 'danger')
         return redirect(url_for('dashboard'))
     
-    prescriptions_list = Prescription.query.order_by(Prescription.created_at.desc()).all()
+    prescriptions_list = Prescription.query.order_by(Prescription.created_at.desc())
     return render_template('prescriptions/index.html', prescriptions=prescriptions_list)
 
 @app.route('/prescriptions/add', methods=['GET', 'POST'])
@@ -355,99 +559,111 @@ def analytics():
     
     return render_template('analytics/index.html')
 
-@app.route('/api/analytics/sales-data')
-@login_required
-def sales_analytics_data():
-    if not current_user.can_access_module('analytics'):
-        return jsonify({'error': 'Access denied'}), 403
+def sales_analytics(session=None):
+    # Sales data for the last 30 days, aggregated per day in each partition the range touches
+    today = datetime.today().date()
+    start = today - timedelta(days=29)
+    totals_by_day = daily_sales_totals(datetime.combine(start, time.min), session=session)
     
-    # Sales data for the last 30 days
     dates = []
     sales_count = []
     revenue_data = []
     
     for i in range(29, -1, -1):
-        date = datetime.today().date() - timedelta(days=i)
-        daily_sales = Sale.query.filter(db.func.date(Sale.created_at) == date).all()
+        date = today - timedelta(days=i)
+        count, revenue = totals_by_day.get(date.isoformat(), (0, 0))
         
         dates.append(date.strftime('%m-%d'))
-        sales_count.append(len(daily_sales))
-        revenue_data.append(float(sum(sale.final_amount for sale in daily_sales)))
+        sales_count.append(count)
+        revenue_data.append(float(revenue or 0))
     
-    return jsonify({
+    return {
         'dates': dates,
         'sales_count': sales_count,
         'revenue': revenue_data
-    })
+    }
 
-@app.route('/api/analytics/stock-data')
-@login_required
-def stock_analytics_data():
-    if not current_user.can_access_module('analytics'):
-        return jsonify({'error': 'Access denied'}), 403
-    
-    # Stock analytics
-    total_medicines = Medicine.query.count()
-    low_stock = Medicine.query.filter(Medicine.quantity <= Medicine.min_stock_level).count()
-    out_of_stock = Medicine.query.filter(Medicine.quantity == 0).count()
-    expiring_soon = Medicine.query.filter(
+def stock_analytics(session=None):
+    medicines = (session or db.session).query(Medicine)
+    total_medicines = medicines.count()
+    low_stock = medicines.filter(Medicine.quantity <= Medicine.min_stock_level).count()
+    out_of_stock = medicines.filter(Medicine.quantity == 0).count()
+    expiring_soon = medicines.filter(
         Medicine.expiry_date <= datetime.today().date() + timedelta(days=30)
     ).count()
     
-    return jsonify({
+    return {
         'total_medicines': total_medicines,
         'low_stock': low_stock,
         'out_of_stock': out_of_stock,
         'expiring_soon': expiring_soon
-    })
+    }
 
-@app.route('/api/analytics/category-data')
-@login_required
-def category_analytics_data():
-    if not current_user.can_access_module('analytics'):
-        return jsonify({'error': 'Access denied'}), 403
-    
+def category_analytics(session=None):
     # Medicine categories distribution
-    categories = db.session.query(
+    categories = (session or db.session).query(
         Medicine.category,
         db.func.count(Medicine.id).label('count')
     ).filter(Medicine.category.isnot(None)).group_by(Medicine.category).all()
     
-    category_labels = [cat[0] for cat in categories]
-    category_data = [cat[1] for cat in categories]
+    return {
+        'labels': [cat[0] for cat in categories],
+        'data': [cat[1] for cat in categories]
+    }
+
+@app.route('/api/analytics/sales-data')
+@login_required
+@conditional(Sale.__tablename__, SalePartition.__tablename__, daily=True)
+def sales_analytics_data():
+    if not current_user.can_access_module('analytics'):
+        return jsonify({'error': 'Access denied'}), 403
     
-    return jsonify({
-        'labels': category_labels,
-        'data': category_data
-    })
+    return jsonify(sales_analytics())
 
-# Reports Routes
-@app.route('/reports')
+@app.route('/api/analytics/stock-data')
 @login_required
-def reports():
-    if not current_user.can_access_module('reports'):
-        flash('Access denied', 'danger')
-        return redirect(url_for('dashboard'))
+@conditional(Medicine.__tablename__, daily=True)
+def stock_analytics_data():
+    if not current_user.can_access_module('analytics'):
+        return jsonify({'error': 'Access denied'}), 403
     
-    return render_template('reports/index.html')
+    return jsonify(stock_analytics())
 
-@app.route('/api/reports/sales-report')
+@app.route('/api/analytics/category-data')
 @login_required
-def sales_report():
-    if not current_user.can_access_module('reports'):
+@conditional(Medicine.__tablename__)
+def category_analytics_data():
+    if not current_user.can_access_module('analytics'):
         return jsonify({'error': 'Access denied'}), 403
     
+    return jsonify(category_analytics())
+
+@app.route('/api/analytics/bundle')
+@login_required
+@conditional(Sale.__tablename__, SalePartition.__tablename__, Medicine.__tablename__, daily=True)
+def analytics_bundle():
+    if not current_user.can_access_module('analytics'):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    # Everything the analytics page needs in one round trip
+    return jsonify({
+        'sales': sales_analytics(),
+        'stock': stock_analytics(),
+        'categories': category_analytics()
+    })
+
+# Reports Routes
+def report_date_range():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    query = Sale.query
-    
-    if start_date:
-        query = query.filter(Sale.created_at >= datetime.strptime(start_date, '%Y-%m-%d'))
-    if end_date:
-        query = query.filter(Sale.created_at <= datetime.strptime(end_date + ' 23:59:59', '%Y-%m-%d %H:%M:%S'))
-    
-    sales = query.order_by(Sale.created_at.desc()).all()
+    start = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+    end = datetime.strptime(end_date + ' 23:59:59', '%Y-%m-%d %H:%M:%S') if end_date else None
+    return start, end
+
+def sales_report_rows(start=None, end=None, session=None):
+    # Only the hot tables and the archived months overlapping the range are read
+    sales = sales_in_range(start, end, session=session)
     
     report_data = []
     for sale in sales:
@@ -455,20 +671,14 @@ def sales_report():
             'invoice_number': sale.invoice_number,
             'date': sale.created_at.strftime('%Y-%m-%d %H:%M'),
             'customer': sale.customer_name,
-            'items': len(sale.items),
+            'items': sale.item_count,
             'total_amount': float(sale.final_amount),
             'payment_method': sale.payment_method
         })
-    
-    return jsonify(report_data)
+    return report_data
 
-@app.route('/api/reports/stock-report')
-@login_required
-def stock_report():
-    if not current_user.can_access_module('reports'):
-        return jsonify({'error': 'Access denied'}), 403
-    
-    medicines = Medicine.query.order_by(Medicine.quantity.asc()).all()
+def stock_report_rows(session=None):
+    medicines = (session or db.session).query(Medicine).order_by(Medicine.quantity.asc()).all()
     
     report_data = []
     for medicine in medicines:
@@ -484,17 +694,44 @@ def stock_report():
                      'Low Stock' if medicine.quantity <= medicine.min_stock_level else 
                      'In Stock'
         })
+    return report_data
+
+@app.route('/reports')
+@login_required
+def reports():
+    if not current_user.can_access_module('reports'):
+        flash('Access denied', 'danger')
+        return redirect(url_for('dashboard'))
     
-    return jsonify(report_data)
+    return render_template('reports/index.html')
+
+@app.route('/api/reports/sales-report')
+@login_required
+@conditional(Sale.__tablename__, SaleItem.__tablename__, SalePartition.__tablename__)
+def sales_report():
+    if not current_user.can_access_module('reports'):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(sales_report_rows(*report_date_range()))
+
+@app.route('/api/reports/stock-report')
+@login_required
+@conditional(Medicine.__tablename__)
+def stock_report():
+    if not current_user.can_access_module('reports'):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(stock_report_rows())
 
 @app.route('/api/reports/export-sales')
 @login_required
+@conditional(Sale.__tablename__, SaleItem.__tablename__, SalePartition.__tablename__)
 def export_sales_report():
     if not current_user.can_access_module('reports'):
         return jsonify({'error': 'Access denied'}), 403
     
     # Generate CSV report
-    sales = Sale.query.order_by(Sale.created_at.desc()).all()
+    sales = sales_in_range()
     
     output = StringIO()
     writer = csv.writer(output)
@@ -505,19 +742,84 @@ def export_sales_report():
             sale.invoice_number,
             sale.created_at.strftime('%Y-%m-%d %H:%M'),
             sale.customer_name,
-            len(sale.items),
+            sale.item_count,
             sale.final_amount,
             sale.payment_method
         ])
     
     output.seek(0)
     return send_file(
-        StringIO(output.getvalue()),
+        io.BytesIO(output.getvalue().encode('utf-8')),
         mimetype='text/csv',
         as_attachment=True,
         download_name=f'sales_report_{datetime.now().strftime("%Y%m%d")}.csv'
     )
 
+# Head Office Routes (all branches)
+def headoffice_response(results, statuses, data):
+    return jsonify({
+        'data': data,
+        'branches': statuses,
+        'partial': len(results) < len(statuses)
+    })
+
+def merge_sales_analytics(results):
+    series = list(results.values())
+    return {
+        'dates': series[0]['dates'] if series else [],
+        'sales_count': [sum(counts) for counts in zip(*(s['sales_count'] for s in series))],
+        'revenue': [sum(revenues) for revenues in zip(*(s['revenue'] for s in series))]
+    }
+
+def merge_category_analytics(results):
+    totals = {}
+    for categories in results.values():
+        for label, count in zip(categories['labels'], categories['data']):
+            totals[label] = totals.get(label, 0) + count
+    return {'labels': list(totals), 'data': list(totals.values())}
+
+@app.route('/api/headoffice/sales-report')
+@login_required
+def headoffice_sales_report():
+    if not current_user.can_access_module('headoffice'):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    start, end = report_date_range()
+    results, statuses = branch_aggregator.run(
+        lambda branch_session: sales_report_rows(start, end, branch_session),
+        app.config['BRANCH_QUERY_TIMEOUT']
+    )
+    return headoffice_response(results, statuses, merge_rows(results, 'date', reverse=True))
+
+@app.route('/api/headoffice/stock-report')
+@login_required
+def headoffice_stock_report():
+    if not current_user.can_access_module('headoffice'):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    results, statuses = branch_aggregator.run(stock_report_rows, app.config['BRANCH_QUERY_TIMEOUT'])
+    return headoffice_response(results, statuses, merge_rows(results, 'quantity'))
+
+@app.route('/api/headoffice/analytics')
+@login_required
+def headoffice_analytics():
+    if not current_user.can_access_module('headoffice'):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    results, statuses = branch_aggregator.run(
+        lambda branch_session: {
+            'sales': sales_analytics(branch_session),
+            'stock': stock_analytics(branch_session),
+            'categories': category_analytics(branch_session)
+        },
+        app.config['BRANCH_QUERY_TIMEOUT']
+    )
+    return headoffice_response(results, statuses, {
+        'sales': merge_sales_analytics({code: r['sales'] for code, r in results.items()}),
+        'stock': merge_counts({code: r['stock'] for code, r in results.items()}),
+        'categories': merge_category_analytics({code: r['categories'] for code, r in results.items()})
+    })
+
 # Settings and User Management Routes
 @app.route('/settings')
 @login_required
@@ -541,6 +843,7 @@ def add_user():
         email = request.form['email']
         password = request.form['password']
         role = request.form['role']
+        branch = request.form.get('branch')
         
         if User.query.filter_by(username=username).first():
             flash('Username already exists', 'danger')
@@ -550,7 +853,8 @@ def add_user():
             flash('Email already exists', 'danger')
             return redirect(url_for('settings'))
         
-        user = User(username=username, email=email, role=role)
+        user = User(username=username, email=email, role=role,
+                    branch=branch if is_branch(branch) and branch != app.config['DEFAULT_BRANCH'] else None)
         user.set_password(password)
         
         db.session.add(user)
@@ -626,36 +930,254 @@ def profile_settings():
     return render_template('settings/profile.html')
 
 # PDF Invoice Generation
+def invoice_snapshots(start_date=None, end_date=None):
+    start = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+    end = datetime.strptime(end_date + ' 23:59:59', '%Y-%m-%d %H:%M:%S') if end_date else None
+    
+    # Past months are the usual export, so archived partitions are read too
+    return [invoice_snapshot(sale, app.config['SECRET_KEY']) for sale in sales_with_items(start, end)]
+
 @app.route('/sales/<int:sale_id>/invoice')
 @login_required
 def generate_invoice(sale_id):
-    sale = Sale.query.get_or_404(sale_id)
+    # Archived months keep their invoices downloadable
+    sale = find_sale(sale_id=sale_id)
+    if sale is None:
+        abort(404)
+    
+    path = invoice_cache.render(invoice_snapshot(sale, app.config['SECRET_KEY']))
+    return send_file(path, as_attachment=True, download_name=f"invoice_{sale.invoice_number}.pdf", mimetype='application/pdf')
+
+@app.route('/api/invoices/export')
+@login_required
+def export_invoices():
+    if not current_user.can_access_module('reports'):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    if not start_date or not end_date:
+        return jsonify({'error': 'start_date and end_date are required; use `flask render-invoices` for full exports'}), 400
+    try:
+        days = (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days + 1
+    except ValueError:
+        return jsonify({'error': 'Dates must be formatted YYYY-MM-DD'}), 400
+    if days < 1:
+        return jsonify({'error': 'end_date must not be before start_date'}), 400
+    if days > app.config['INVOICE_EXPORT_MAX_DAYS']:
+        return jsonify({'error': f"Export at most {app.config['INVOICE_EXPORT_MAX_DAYS']} days at a time; "
+                                 "use `flask render-invoices` for longer ranges"}), 400
     
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
+    snapshots = invoice_snapshots(start_date, end_date)
+    if len(snapshots) > app.config['INVOICE_EXPORT_MAX_INVOICES']:
+        return jsonify({'error': f"{len(snapshots)} invoices in range; export at most "
+                                 f"{app.config['INVOICE_EXPORT_MAX_INVOICES']} at a time or use `flask render-invoices`"}), 400
     
-    # Add invoice content
-    p.drawString(100, 750, f"Invoice: {sale.invoice_number}")
-    p.drawString(100, 730, f"Date: {sale.created_at.strftime('%Y-%m-%d %H:%M')}")
-    p.drawString(100, 710, f"Customer: {sale.customer_name}")
+    # Spill large archives to disk instead of holding the whole ZIP in memory
+    archive_file = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    write_invoices_zip(snapshots, invoice_cache, archive_file, app.config['INVOICE_RENDER_WORKERS'], invoice_pool)
     
-    y_position = 680
-    for item in sale.items:
-        p.drawString(100, y_position, f"{item.medicine.name} - {item.quantity} x ${item.unit_price}")
-        y_position -= 20
+    archive_file.seek(0)
+    return send_file(
+        archive_file,
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name=f"invoices_{start_date}_{end_date}.zip"
+    )
+
+@app.route('/invoices/verify')
+@login_required
+def verify_invoice():
+    # Check a scanned invoice QR code against the stored sale
+    parsed = parse_verification_payload(request.args.get('payload'))
+    if parsed is None:
+        return jsonify({'valid': False, 'message': 'Unrecognised invoice code'}), 400
+    
+    invoice_number, final_amount, code = parsed
+    sale = find_sale(invoice_number=invoice_number)
+    valid = (
+        sale is not None
+        and abs(sale.final_amount - final_amount) < 0.005
+        and hmac.compare_digest(
+            code.encode(), verification_code(invoice_number, final_amount, app.config['SECRET_KEY']).encode()
+        )
+    )
     
-    p.drawString(100, y_position - 40, f"Total Amount: ${sale.final_amount}")
+    return jsonify({
+        'valid': valid,
+        'invoice_number': invoice_number,
+        'final_amount': final_amount,
+        'sale_id': sale.id if valid else None
+    })
+
+@app.cli.command('render-invoices')
+@click.option('--start', 'start_date', help='First sale date (YYYY-MM-DD).')
+@click.option('--end', 'end_date', help='Last sale date (YYYY-MM-DD).')
+@click.option('--output', required=True, type=click.Path(dir_okay=False), help='ZIP file to write.')
+@click.option('--workers', type=int, default=None, help='Render processes (default: CPU count).')
+@branch_option
+def render_invoices_command(start_date, end_date, output, workers, branch):
+    """Render the invoices of a date range into a ZIP archive."""
+    use_branch(branch)
+    started = perf_counter()
+    with open(output, 'wb') as zip_file:
+        count = write_invoices_zip(invoice_snapshots(start_date, end_date), invoice_cache, zip_file, workers)
+    click.echo(f"Wrote {count} invoices to {output} in {perf_counter() - started:.1f}s")
+
+@app.cli.command('bench-invoices')
+@click.option('--count', default=2000, show_default=True, help='Synthetic invoices to render.')
+@click.option('--items', default=8, show_default=True, help='Line items per invoice.')
+@click.option('--workers', type=int, default=None, help='Render processes (default: CPU count).')
+def bench_invoices_command(count, items, workers):
+    """Measure uncached invoice rendering throughput."""
+    snapshots = [{
+        'sale_id': sale_id,
+        'invoice_number': f"BENCH-{sale_id:06d}",
+        'date': '2024-01-01 12:00',
+        'customer_name': 'Walk-in Customer',
+        'customer_phone': '',
+        'payment_method': 'cash',
+        'total_amount': items * 2.5,
+        'discount': 0.0,
+        'tax_amount': 0.0,
+        'final_amount': items * 2.5,
+        'items': [{'name': f"Medicine {n}", 'quantity': 1, 'unit_price': 2.5, 'total_price': 2.5} for n in range(items)],
+        'verification': f"MEDISYNC|BENCH-{sale_id:06d}|{items * 2.5:.2f}|0000000000000000"
+    } for sale_id in range(count)]
     
-    p.showPage()
-    p.save()
+    with tempfile.TemporaryDirectory() as directory:
+        started = perf_counter()
+        render_invoices(snapshots, InvoiceCache(directory), workers)
+        elapsed = perf_counter() - started
+    click.echo(f"Rendered {count} invoices in {elapsed:.1f}s ({count / elapsed * 60:,.0f} invoices/minute)")
+
+@app.cli.command('prune-invoice-cache')
+@click.option('--max-age-days', type=float, help='Delete PDFs not used for this many days.')
+@click.option('--max-size-mb', type=float, help='Then delete the least recently used PDFs until the cache fits.')
+@click.option('--all', 'clear_all', is_flag=True, help='Empty the cache.')
+def prune_invoice_cache_command(max_age_days, max_size_mb, clear_all):
+    """Delete cached invoice PDFs by age and total size."""
+    if not clear_all and max_age_days is None and max_size_mb is None:
+        raise click.UsageError('Pass --max-age-days, --max-size-mb or --all.')
     
-    buffer.seek(0)
-    return send_file(buffer, as_attachment=True, download_name=f"invoice_{sale.invoice_number}.pdf", mimetype='application/pdf')
+    max_age = max_age_days * 86400 if max_age_days is not None else None
+    max_bytes = 0 if clear_all else (int(max_size_mb * 1024 * 1024) if max_size_mb is not None else None)
+    removed, freed = invoice_cache.prune(max_age=max_age, max_bytes=max_bytes)
+    click.echo(f"Removed {removed} cached invoices ({freed / 1024 / 1024:.1f} MB)")
+
+@app.cli.command('bench-templates')
+@click.option('--rows', default=1000, show_default=True, help='Rows per table.')
+@click.option('--repeat', default=20, show_default=True, help='Renders per measurement.')
+def bench_templates_command(rows, repeat):
+    """Measure table page render time with and without the fragment cache."""
+    now = datetime.utcnow()
+    medicines_rows = [SimpleNamespace(
+        id=n, name=f"Medicine {n}", generic_name=f"Generic {n}", batch_number=f"B{n:06d}",
+        quantity=n % 50, min_stock_level=10, price=n * 0.37, expiry_date=now.date(), updated_at=now
+    ) for n in range(rows)]
+    sales_rows = [SimpleNamespace(
+        id=n, invoice_number=f"INV-{n:06d}", customer_name='Walk-in Customer', customer_phone='0700000000',
+        created_at=now, items=[None] * 3, final_amount=n * 1.25, payment_method=('cash', 'card', 'upi')[n % 3]
+    ) for n in range(rows)]
+    prescriptions_rows = [SimpleNamespace(
+        id=n, patient_name=f"Patient {n}", patient_age=30 + n % 50, patient_gender='F', doctor_name='Dr. Smith',
+        doctor_license='LIC-1', date_issued=now.date(), diagnosis='Seasonal allergy ' * 5, is_fulfilled=n % 2 == 0
+    ) for n in range(rows)]
+    pages = [
+        ('/medicines', 'medicines/index.html', {'medicines': medicines_rows}),
+        ('/sales', 'sales/index.html', {'sales': sales_rows}),
+        ('/prescriptions', 'prescriptions/index.html', {'prescriptions': prescriptions_rows})
+    ]
+    
+    enabled = fragment_cache.enabled
+    try:
+        for path, template, context in pages:
+            with app.test_request_context(path):
+                login_user(User(id=0, username='bench', email='bench@medisync.local', role='admin', is_active=True))
+                timings = {}
+                for label, use_cache in (('uncached', False), ('cached', True)):
+                    fragment_cache.enabled = use_cache
+                    fragment_cache.clear()
+                    render_template(template, **context)  # warm-up, fills the cache
+                    started = perf_counter()
+                    for _ in range(repeat):
+                        render_template(template, **context)
+                    timings[label] = (perf_counter() - started) / repeat * 1000
+            click.echo(
+                f"{template:<28} {timings['uncached']:8.2f} ms uncached  {timings['cached']:8.2f} ms cached  "
+                f"({timings['uncached'] / timings['cached']:.0f}x)"
+            )
+    finally:
+        fragment_cache.enabled = enabled
+        fragment_cache.clear()
+
+# Sales archive
+@app.cli.command('archive-sales')
+@click.option('--month', help='Closed month to archive (YYYY-MM); defaults to every closed month.')
+@branch_option
+def archive_sales_command(month, branch):
+    """Move closed months of sales into monthly archive tables."""
+    use_branch(branch)
+    months = [month] if month else archivable_months()
+    for month in months:
+        try:
+            partition = archive_month(month)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Archived {month}: {partition.sale_count} sales, {partition.item_count} items")
+    if not months:
+        click.echo('Nothing to archive')
+
+@app.cli.command('restore-sales')
+@click.option('--month', required=True, help='Archived month to restore (YYYY-MM).')
+@branch_option
+def restore_sales_command(month, branch):
+    """Move an archived month of sales back into the live tables."""
+    use_branch(branch)
+    try:
+        restore_month(month)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Restored {month}")
+
+@app.cli.command('verify-archive')
+@click.option('--month', help='Archived month to verify (YYYY-MM); defaults to all.')
+@branch_option
+def verify_archive_command(month, branch):
+    """Check archived months against the checksums taken when archiving."""
+    use_branch(branch)
+    months = [month] if month else [partition.month for partition in SalePartition.query.order_by(SalePartition.month)]
+    failed = []
+    for month in months:
+        try:
+            ok = verify_month(month)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"{month}: {'ok' if ok else 'CHECKSUM MISMATCH'}")
+        if not ok:
+            failed.append(month)
+    if failed:
+        raise click.ClickException(f"{len(failed)} archived month(s) failed verification")
 
 # Initialize database
 def create_tables():
     with app.app_context():
-        db.create_all()
+        # Every branch shard gets the full schema; users are only ever read from the default one
+        for branch in branch_codes():
+            db.session.info['branch'] = branch
+            engine = db.session.get_bind()
+            db.metadata.create_all(engine)
+            # create_all() skips existing tables, so add indexes and columns introduced later explicitly
+            for index in Sale.__table__.indexes:
+                index.create(engine, checkfirst=True)
+            if 'branch' not in {column['name'] for column in db.inspect(engine).get_columns('users')}:
+                with engine.begin() as connection:
+                    connection.execute(db.text('ALTER TABLE users ADD COLUMN branch VARCHAR(50)'))
+            with engine.begin() as connection:
+                reserve_archived_ids(connection)
+            seed_data_versions()
+        db.session.info['branch'] = app.config['DEFAULT_BRANCH']
+        
         # Create default admin user if not exists
         if not User.query.filter_by(username='admin').first():
             admin = User(username='admin', email='admin@medisync.com', role='admin')
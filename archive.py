@@ -0,0 +1,361 @@
+import hashlib
+import threading
+from collections import namedtuple
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import Column, MetaData, Table, and_, delete, func, insert, select, text, union_all
+
+from models import db, Medicine, Sale, SaleItem, SalePartition
+from versioning import bump_data_version
+
+# Archive tables are created on demand, so they live outside db.metadata and
+# are never touched by db.create_all()
+archive_metadata = MetaData()
+_archive_metadata_lock = threading.Lock()
+
+SaleRow = namedtuple('SaleRow', 'id invoice_number created_at customer_name item_count final_amount payment_method')
+
+
+def month_key(moment):
+    return moment.strftime('%Y-%m')
+
+
+def month_bounds(month):
+    """[start, end) datetimes of a YYYY-MM month"""
+    start = datetime.strptime(month, '%Y-%m')
+    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+
+def _archive_table(source, name):
+    columns = [
+        Column(column.name, column.type, primary_key=column.primary_key,
+               index=column.name in ('sale_id', 'invoice_number'))
+        for column in source.columns
+    ]
+    return Table(name, archive_metadata, *columns)
+
+
+def archive_tables(month):
+    """(sale table, item table) holding an archived month"""
+    suffix = month.replace('-', '')
+    sale_name = f"{Sale.__tablename__}_archive_{suffix}"
+    item_name = f"{SaleItem.__tablename__}_archive_{suffix}"
+    # Head-office queries resolve partitions from several branch threads at once
+    with _archive_metadata_lock:
+        if sale_name not in archive_metadata.tables:
+            _archive_table(Sale.__table__, sale_name)
+            _archive_table(SaleItem.__table__, item_name)
+        return archive_metadata.tables[sale_name], archive_metadata.tables[item_name]
+
+
+def sale_partitions(start=None, end=None, session=None):
+    """(sale table, item table) pairs that can hold sales between ``start``
+    and ``end``: the hot tables plus every archived month overlapping the range"""
+    session = session or db.session
+    partitions = [(Sale.__table__, SaleItem.__table__)]
+    for month in session.scalars(select(SalePartition.month).order_by(SalePartition.month)):
+        month_start, month_end = month_bounds(month)
+        if (end is None or month_start <= end) and (start is None or month_end > start):
+            partitions.append(archive_tables(month))
+    return partitions
+
+
+def _in_range(sale_table, start, end, end_exclusive=False):
+    conditions = []
+    if start is not None:
+        conditions.append(sale_table.c.created_at >= start)
+    if end is not None:
+        conditions.append(sale_table.c.created_at < end if end_exclusive else sale_table.c.created_at <= end)
+    return and_(True, *conditions)
+
+
+def sales_in_range(start=None, end=None, session=None):
+    """Sales with their item counts across hot and archived partitions, newest first"""
+    session = session or db.session
+    queries = []
+    for sale_table, item_table in sale_partitions(start, end, session):
+        item_count = select(func.count(item_table.c.id)).where(
+            item_table.c.sale_id == sale_table.c.id
+        ).scalar_subquery()
+        queries.append(select(
+            sale_table.c.id,
+            sale_table.c.invoice_number,
+            sale_table.c.created_at,
+            sale_table.c.customer_name,
+            item_count.label('item_count'),
+            sale_table.c.final_amount,
+            sale_table.c.payment_method
+        ).where(_in_range(sale_table, start, end)))
+
+    combined = union_all(*queries)
+    combined = combined.order_by(combined.selected_columns.created_at.desc())
+    return [SaleRow(*row) for row in session.execute(combined)]
+
+
+def _sales_with_items(session, partitions, condition):
+    medicines = Medicine.__table__
+    sales = []
+    for sale_table, item_table in partitions:
+        matching = condition(sale_table)
+        partition_sales = {
+            row.id: SimpleNamespace(**row._mapping, items=[])
+            for row in session.execute(select(sale_table).where(matching))
+        }
+        if not partition_sales:
+            continue
+
+        items = session.execute(
+            select(item_table, medicines.c.name.label('medicine_name'))
+            .outerjoin(medicines, medicines.c.id == item_table.c.medicine_id)
+            .where(item_table.c.sale_id.in_(select(sale_table.c.id).where(matching)))
+            .order_by(item_table.c.id)
+        )
+        for row in items:
+            values = dict(row._mapping)
+            name = values.pop('medicine_name')
+            medicine = SimpleNamespace(name=name) if name is not None else None
+            partition_sales[values['sale_id']].items.append(SimpleNamespace(**values, medicine=medicine))
+        sales.extend(partition_sales.values())
+    return sales
+
+
+def sales_with_items(start=None, end=None, session=None):
+    """Full sales with their line items across hot and archived partitions, oldest first.
+
+    Rows are plain namespaces shaped like ``Sale`` and ``SaleItem`` (``item.medicine``
+    only carries the medicine name), so archived months print like hot ones.
+    """
+    session = session or db.session
+    sales = _sales_with_items(session, sale_partitions(start, end, session),
+                              lambda sale_table: _in_range(sale_table, start, end))
+    sales.sort(key=lambda sale: sale.created_at)
+    return sales
+
+
+def find_sale(sale_id=None, invoice_number=None, session=None):
+    """One sale, shaped like ``sales_with_items()`` rows, by id or invoice number
+    from whichever partition holds it; None if there is no such sale"""
+    session = session or db.session
+
+    def matches(sale_table):
+        if sale_id is not None:
+            return sale_table.c.id == sale_id
+        return sale_table.c.invoice_number == invoice_number
+
+    # The hot tables come first, so recent sales never touch the archives
+    for partition in sale_partitions(session=session):
+        sales = _sales_with_items(session, [partition], matches)
+        if sales:
+            return sales[0]
+    return None
+
+
+def daily_sales_totals(start, end=None, session=None):
+    """{'YYYY-MM-DD': (sale count, revenue)} across hot and archived partitions"""
+    session = session or db.session
+    totals = {}
+    for sale_table, _ in sale_partitions(start, end, session):
+        sale_day = func.date(sale_table.c.created_at)
+        rows = session.execute(
+            select(sale_day, func.count(sale_table.c.id), func.sum(sale_table.c.final_amount))
+            .where(_in_range(sale_table, start, end))
+            .group_by(sale_day)
+        )
+        for day, count, revenue in rows:
+            previous_count, previous_revenue = totals.get(str(day), (0, 0))
+            totals[str(day)] = (previous_count + count, previous_revenue + (revenue or 0))
+    return totals
+
+
+def partition_checksum(session, sale_table, item_table, start, end):
+    """(sha256, sale count, item count) over every column of a month's sales and items"""
+    in_month = _in_range(sale_table, start, end, end_exclusive=True)
+    sale_ids = select(sale_table.c.id).where(in_month)
+    digest = hashlib.sha256()
+
+    sale_count = 0
+    for row in session.execute(select(sale_table).where(in_month).order_by(sale_table.c.id)):
+        digest.update(('sale|' + '|'.join(map(repr, row)) + '\n').encode())
+        sale_count += 1
+
+    item_count = 0
+    items = select(item_table).where(item_table.c.sale_id.in_(sale_ids)).order_by(item_table.c.id)
+    for row in session.execute(items):
+        digest.update(('item|' + '|'.join(map(repr, row)) + '\n').encode())
+        item_count += 1
+
+    return digest.hexdigest(), sale_count, item_count
+
+
+def archivable_months(session=None):
+    """Closed months that still have sales in the hot tables"""
+    session = session or db.session
+    first_sale = session.scalar(select(func.min(Sale.created_at)))
+    if first_sale is None:
+        return []
+
+    current_month = month_key(datetime.utcnow())
+    months = []
+    month = month_key(first_sale)
+    while month < current_month:
+        start, end = month_bounds(month)
+        if session.scalar(select(func.count(Sale.id)).where(_in_range(Sale.__table__, start, end, True))):
+            months.append(month)
+        month = month_key(end)
+    return months
+
+
+def archive_month(month, session=None):
+    """Move a closed month of sales and items into its archive tables"""
+    session = session or db.session
+    if month >= month_key(datetime.utcnow()):
+        raise ValueError(f"{month} is not a closed month yet")
+    if session.get(SalePartition, month) is not None:
+        raise ValueError(f"{month} is already archived")
+
+    start, end = month_bounds(month)
+    hot_sales, hot_items = Sale.__table__, SaleItem.__table__
+    checksum, sale_count, item_count = partition_checksum(session, hot_sales, hot_items, start, end)
+    if not sale_count:
+        raise ValueError(f"No sales to archive for {month}")
+
+    try:
+        connection = session.connection()
+        sale_table, item_table = archive_tables(month)
+        sale_table.create(connection, checkfirst=True)
+        item_table.create(connection, checkfirst=True)
+
+        in_month = _in_range(hot_sales, start, end, end_exclusive=True)
+        month_sale_ids = select(hot_sales.c.id).where(in_month)
+        connection.execute(insert(sale_table).from_select(
+            [column.name for column in hot_sales.columns], select(hot_sales).where(in_month)
+        ))
+        connection.execute(insert(item_table).from_select(
+            [column.name for column in hot_items.columns],
+            select(hot_items).where(hot_items.c.sale_id.in_(month_sale_ids))
+        ))
+
+        if partition_checksum(session, sale_table, item_table, start, end)[0] != checksum:
+            raise ValueError(f"Archive copy of {month} does not match the hot tables")
+
+        connection.execute(delete(hot_items).where(hot_items.c.sale_id.in_(month_sale_ids)))
+        connection.execute(delete(hot_sales).where(in_month))
+        bump_data_version(connection, hot_sales.name, hot_items.name)
+
+        partition = SalePartition(month=month, sale_count=sale_count, item_count=item_count, checksum=checksum)
+        session.add(partition)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return partition
+
+
+def restore_month(month, session=None):
+    """Move an archived month back into the hot tables and drop its archive"""
+    session = session or db.session
+    partition = session.get(SalePartition, month)
+    if partition is None:
+        raise ValueError(f"{month} is not archived")
+
+    start, end = month_bounds(month)
+    hot_sales, hot_items = Sale.__table__, SaleItem.__table__
+    sale_table, item_table = archive_tables(month)
+
+    try:
+        # Ids freed by archiving may have been reused by newer sales
+        for archived, hot in ((sale_table, hot_sales), (item_table, hot_items)):
+            clashes = session.scalar(
+                select(func.count()).select_from(archived.join(hot, archived.c.id == hot.c.id))
+            )
+            if clashes:
+                raise ValueError(f"Cannot restore {month}: {clashes} {hot.name} ids are already in use")
+
+        connection = session.connection()
+        connection.execute(insert(hot_sales).from_select(
+            [column.name for column in sale_table.columns], select(sale_table)
+        ))
+        connection.execute(insert(hot_items).from_select(
+            [column.name for column in item_table.columns], select(item_table)
+        ))
+
+        if partition_checksum(session, hot_sales, hot_items, start, end)[0] != partition.checksum:
+            raise ValueError(f"Restored {month} does not match its archive checksum")
+
+        item_table.drop(connection)
+        sale_table.drop(connection)
+        bump_data_version(connection, hot_sales.name, hot_items.name)
+        session.delete(partition)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+
+def verify_month(month, session=None):
+    """True if an archived month still matches the checksum taken when it was archived"""
+    session = session or db.session
+    partition = session.get(SalePartition, month)
+    if partition is None:
+        raise ValueError(f"{month} is not archived")
+
+    start, end = month_bounds(month)
+    sale_table, item_table = archive_tables(month)
+    checksum, sale_count, item_count = partition_checksum(session, sale_table, item_table, start, end)
+    return (checksum, sale_count, item_count) == (partition.checksum, partition.sale_count, partition.item_count)
+
+
+def _rebuild_with_autoincrement(connection, table):
+    # SQLite cannot add AUTOINCREMENT in place: move the rows into a fresh copy
+    old_name = f"_{table.name}_without_autoincrement"
+    # Keep other tables' foreign keys pointing at the original name
+    connection.exec_driver_sql('PRAGMA legacy_alter_table = ON')
+    try:
+        connection.exec_driver_sql(f'ALTER TABLE "{table.name}" RENAME TO "{old_name}"')
+    finally:
+        connection.exec_driver_sql('PRAGMA legacy_alter_table = OFF')
+    index_names = connection.scalars(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"
+    ), {'table': old_name}).all()
+    for index_name in index_names:
+        connection.exec_driver_sql(f'DROP INDEX "{index_name}"')
+
+    table.create(connection)
+    columns = ', '.join(f'"{column.name}"' for column in table.columns)
+    connection.exec_driver_sql(f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{old_name}"')
+    connection.exec_driver_sql(f'DROP TABLE "{old_name}"')
+
+
+def reserve_archived_ids(connection):
+    """Make sure SQLite never reissues a sale or item id that an archive still holds.
+
+    Without AUTOINCREMENT, SQLite picks max(id) + 1, so a hot table emptied by
+    archiving starts again at 1 and restoring the month then clashes. Rebuilds
+    tables created before ``sqlite_autoincrement`` and moves their sequences
+    past every archived id. Other databases never reuse sequence values.
+    """
+    if connection.dialect.name != 'sqlite':
+        return
+
+    months = connection.scalars(select(SalePartition.month)).all()
+    for index, hot in enumerate((Sale.__table__, SaleItem.__table__)):
+        definition = connection.scalar(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :table"), {'table': hot.name}
+        )
+        if 'AUTOINCREMENT' not in definition.upper():
+            _rebuild_with_autoincrement(connection, hot)
+
+        highest = connection.scalar(select(func.max(hot.c.id))) or 0
+        for month in months:
+            archived = archive_tables(month)[index]
+            highest = max(highest, connection.scalar(select(func.max(archived.c.id))) or 0)
+
+        sequence = connection.scalar(text('SELECT seq FROM sqlite_sequence WHERE name = :table'), {'table': hot.name})
+        if sequence is None:
+            connection.execute(text('INSERT INTO sqlite_sequence (name, seq) VALUES (:table, :seq)'),
+                               {'table': hot.name, 'seq': highest})
+        elif sequence < highest:
+            connection.execute(text('UPDATE sqlite_sequence SET seq = :seq WHERE name = :table'),
+                               {'table': hot.name, 'seq': highest})
@@ -0,0 +1,243 @@
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import subprocess
+import tempfile
+import urllib.request
+from urllib.parse import urljoin, urlsplit
+
+try:
+    import brotli
+except ImportError:  # optional; .br variants are skipped without it
+    brotli = None
+
+# Built files are fingerprinted, so browsers may keep them for a year
+ASSET_MAX_AGE = 31536000
+
+FONT_AWESOME = 'https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0'
+
+# Third-party files, pinned to exact versions.
+# Logical name -> source URL; relative url() references inside vendored CSS
+# (e.g. Font Awesome webfonts) are fetched alongside automatically.
+# Chart.js stays on its versioned CDN URL until its digest is pinned here too.
+VENDOR_ASSETS = {
+    'css/fontawesome.css': f'{FONT_AWESOME}/css/all.min.css',
+}
+
+# SHA-256 of every file the build vendors, including the ones vendored CSS
+# references; a download or cached copy that is missing here or differs fails the build
+VENDOR_SHA256 = {
+    f'{FONT_AWESOME}/css/all.min.css': '8d321d88cb97fdedc3189506c25de9292c6e73a60ebaab496243346c6404480e',
+    f'{FONT_AWESOME}/webfonts/fa-brands-400.ttf': '9e122861bc5f7d6190d580b22acc5b1c3f8cdba9f495593cccd3b47d2cbfa2fd',
+    f'{FONT_AWESOME}/webfonts/fa-brands-400.woff2': '29bc44694c394921d1f00271128a2e4cd8293516216e24eac07a73fa821fc1f5',
+    f'{FONT_AWESOME}/webfonts/fa-regular-400.ttf': '709034805d10429d24862ad685d561808328329debdbca4f70487b508320a3ff',
+    f'{FONT_AWESOME}/webfonts/fa-regular-400.woff2': 'fa79fc4f2559112ff3dd27cf5be216d9b5f88066ceef728264f5a3a1a195fc1e',
+    f'{FONT_AWESOME}/webfonts/fa-solid-900.ttf': '1782156bfa2054db429277b42f143298a1ce03437c05e2779ca7875112b19d3c',
+    f'{FONT_AWESOME}/webfonts/fa-solid-900.woff2': '1b099f88c06ed0869872561c157f0ec9cbe133a0939d9ece4ee1e1f54bd4683d',
+    f'{FONT_AWESOME}/webfonts/fa-v4compatibility.ttf': 'fde941c0964fab984f6af0697b3fec92e7df384eec9941babfd3e4cbbd6211c2',
+    f'{FONT_AWESOME}/webfonts/fa-v4compatibility.woff2': 'b3abfccce275536beaaeba990e900a0c08ed2fefbabf4a8bcbb2e2ffe3f2431f',
+}
+
+# Project files copied through the pipeline as-is: logical name -> path under the project root
+LOCAL_ASSETS = {
+    'js/main.js': 'static/js/main.js',
+}
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.ttf', '.eot', '.json')
+CSS_URL = re.compile(r'url\(\s*(["\']?)([^)"\']+)\1\s*\)')
+
+
+class AssetManifest:
+    """Maps logical asset names to their fingerprinted build output.
+
+    The manifest file is re-read whenever it changes on disk, so a running
+    server picks up a fresh ``flask build-assets`` without a restart.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._entries = {}
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            self._mtime, self._entries = None, {}
+            return
+        if mtime != self._mtime:
+            with open(self.path) as manifest_file:
+                self._entries = json.load(manifest_file)
+            self._mtime = mtime
+
+    @property
+    def loaded(self):
+        self._refresh()
+        return bool(self._entries)
+
+    def lookup(self, name):
+        self._refresh()
+        return self._entries.get(name)
+
+
+class AssetBuilder:
+    """Builds the purged Tailwind bundle and fingerprinted, precompressed
+    copies of every vendored and local asset into ``dist_dir``."""
+
+    def __init__(self, root, dist_dir, tailwind_cli=None):
+        self.root = root
+        self.dist_dir = dist_dir
+        self.vendor_dir = os.path.join(root, 'assets', 'vendor')
+        self.tailwind_cli = tailwind_cli or os.environ.get('TAILWIND_CLI') or shutil.which('tailwindcss')
+        self.output_dir = dist_dir
+        self.manifest = {}
+
+    def build(self):
+        if not self.tailwind_cli:
+            raise RuntimeError(
+                'Tailwind CLI not found; install the standalone tailwindcss v3 binary '
+                'on PATH or point TAILWIND_CLI at it'
+            )
+
+        # Build into a staging directory so a failed build leaves the live
+        # dist and its manifest untouched
+        parent = os.path.dirname(os.path.abspath(self.dist_dir))
+        os.makedirs(parent, exist_ok=True)
+        self.output_dir = tempfile.mkdtemp(prefix='.assets-build-', dir=parent)
+        self.manifest = {}
+        try:
+            self.emit('css/app.css', self.compile_tailwind())
+            for name, url in VENDOR_ASSETS.items():
+                self.emit_vendor(name, url)
+            for name, path in LOCAL_ASSETS.items():
+                with open(os.path.join(self.root, path), 'rb') as source:
+                    self.emit(name, source.read())
+
+            with open(os.path.join(self.output_dir, 'manifest.json'), 'w') as manifest_file:
+                json.dump(self.manifest, manifest_file, indent=2, sort_keys=True)
+            self.publish()
+        finally:
+            shutil.rmtree(self.output_dir, ignore_errors=True)
+        return self.manifest
+
+    def read_manifest(self):
+        try:
+            with open(os.path.join(self.dist_dir, 'manifest.json')) as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return {}
+
+    def publish(self):
+        """Move the staged build into ``dist_dir``, switching the manifest last.
+
+        Fingerprinted names never change content, so moving them in ahead of
+        the manifest is invisible to a running server; the manifest itself is
+        swapped with a single atomic rename.
+        """
+        previous = self.read_manifest()
+        os.makedirs(self.dist_dir, exist_ok=True)
+        for directory, _, filenames in os.walk(self.output_dir):
+            for filename in filenames:
+                source = os.path.join(directory, filename)
+                relative = os.path.relpath(source, self.output_dir)
+                if relative == 'manifest.json':
+                    continue
+                target = os.path.join(self.dist_dir, relative)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(source, target)
+        os.replace(os.path.join(self.output_dir, 'manifest.json'), os.path.join(self.dist_dir, 'manifest.json'))
+        self.prune(set(previous.values()) | set(self.manifest.values()))
+
+    def prune(self, keep):
+        # Keep the previous build's files too: pages cached before this build still reference them
+        for directory, _, filenames in os.walk(self.dist_dir):
+            for filename in filenames:
+                relative = os.path.relpath(os.path.join(directory, filename), self.dist_dir).replace(os.sep, '/')
+                built = relative[:-3] if relative.endswith(('.gz', '.br')) else relative
+                if relative != 'manifest.json' and built not in keep:
+                    os.remove(os.path.join(directory, filename))
+
+    def compile_tailwind(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'app.css')
+            subprocess.run([
+                self.tailwind_cli,
+                '--config', os.path.join(self.root, 'tailwind.config.js'),
+                '--input', os.path.join(self.root, 'assets', 'css', 'app.css'),
+                '--output', output,
+                '--minify'
+            ], cwd=self.root, check=True)
+            with open(output, 'rb') as css_file:
+                return css_file.read()
+
+    def fetch(self, url):
+        """Download a vendored file once; later builds reuse the local copy.
+        Either way the bytes must match the pinned SHA-256."""
+        parts = urlsplit(url)
+        path = os.path.join(self.vendor_dir, parts.netloc, *parts.path.strip('/').split('/'))
+        if os.path.exists(path):
+            with open(path, 'rb') as vendor_file:
+                return self.verify(url, vendor_file.read())
+
+        with urllib.request.urlopen(url, timeout=30) as response:
+            data = self.verify(url, response.read())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as vendor_file:
+            vendor_file.write(data)
+        return data
+
+    @staticmethod
+    def verify(url, data):
+        digest = hashlib.sha256(data).hexdigest()
+        expected = VENDOR_SHA256.get(url)
+        if expected is None:
+            raise RuntimeError(
+                f"No pinned SHA-256 for {url} (got {digest}); check it against the "
+                "upstream release and add it to VENDOR_SHA256"
+            )
+        if digest != expected:
+            raise RuntimeError(f"SHA-256 mismatch for {url}: expected {expected}, got {digest}")
+        return data
+
+    def emit_vendor(self, name, url):
+        data = self.fetch(url)
+        if name.endswith('.css'):
+            data = self.rewrite_css_urls(name, url, data.decode('utf-8')).encode('utf-8')
+        return self.emit(name, data)
+
+    def rewrite_css_urls(self, name, url, css):
+        # Vendor what the stylesheet references and point it at the fingerprinted copies
+        css_dir = posixpath.dirname(name)
+
+        def replace(match):
+            reference = match.group(2)
+            if reference.startswith(('data:', '#')) or '://' in reference or reference.startswith('/'):
+                return match.group(0)
+            path = reference.split('?', 1)[0].split('#', 1)[0]
+            logical = posixpath.normpath(posixpath.join(css_dir, path))
+            built = self.manifest.get(logical) or self.emit(logical, self.fetch(urljoin(url, path)))
+            return f"url({posixpath.relpath(built, css_dir or '.')})"
+
+        return CSS_URL.sub(replace, css)
+
+    def emit(self, name, data):
+        stem, extension = posixpath.splitext(name)
+        built = f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{extension}"
+        path = os.path.join(self.output_dir, *built.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'wb') as output:
+            output.write(data)
+        if extension in COMPRESSIBLE_EXTENSIONS:
+            with open(path + '.gz', 'wb') as output:
+                output.write(gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(path + '.br', 'wb') as output:
+                    output.write(brotli.compress(data, quality=11))
+
+        self.manifest[name] = built
+        return built
@@ -0,0 +1,138 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy.orm import Session
+
+from models import db
+
+
+def branch_codes():
+    """The default branch first, then every configured shard"""
+    return [current_app.config['DEFAULT_BRANCH'], *current_app.config['BRANCH_DATABASES']]
+
+
+def is_branch(code):
+    return code in branch_codes()
+
+
+def branch_engine(code):
+    if code == current_app.config['DEFAULT_BRANCH']:
+        return db.engines[None]
+    return db.engines[f'branch:{code}']
+
+
+class ShardTimeout(TimeoutError):
+    pass
+
+
+@contextmanager
+def statement_timeout(connection, deadline):
+    """Abort statements on ``connection`` that are still running at ``deadline``
+    (a ``time.monotonic()`` value), so a hung shard frees its thread"""
+    seconds = max(deadline - time.monotonic(), 0.001)
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        driver_connection = connection.connection.driver_connection
+        # A non-zero return from the progress handler interrupts the running statement
+        driver_connection.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+        try:
+            yield
+        finally:
+            driver_connection.set_progress_handler(None, 0)
+    elif dialect == 'postgresql':
+        # Scoped to the task's transaction, which ends when its session closes
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(seconds * 1000)}")
+        yield
+    elif dialect in ('mysql', 'mariadb'):
+        connection.exec_driver_sql(f"SET SESSION max_execution_time = {int(seconds * 1000)}")
+        try:
+            yield
+        finally:
+            connection.exec_driver_sql('SET SESSION max_execution_time = DEFAULT')
+    else:
+        yield
+
+
+class BranchAggregator:
+    """Runs the same query against every branch shard on a thread pool.
+
+    Each task gets its own plain SQLAlchemy session bound to one shard, so it
+    must use ``session.query(...)`` rather than ``Model.query``. The deadline is
+    enforced on the shard connection too, so a hung shard cannot keep pool
+    threads busy. Shards that fail or miss the deadline are reported instead of
+    failing the whole call.
+    """
+
+    def __init__(self, calls_per_branch=4):
+        # Threads per branch: how many head-office calls can run at once
+        self.calls_per_branch = calls_per_branch
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self, branch_count):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=branch_count * self.calls_per_branch, thread_name_prefix='branch-query'
+                )
+            return self._executor
+
+    @staticmethod
+    def _run(engine, task, deadline):
+        started = time.perf_counter()
+        session = Session(bind=engine)
+        try:
+            with statement_timeout(session.connection(), deadline):
+                return task(session), time.perf_counter() - started
+        except Exception as e:
+            if time.monotonic() >= deadline:
+                raise ShardTimeout() from e
+            raise
+        finally:
+            session.close()
+
+    def run(self, task, timeout):
+        """Return ({branch: result}, {branch: status}) for the branches that answered in time"""
+        codes = branch_codes()
+        executor = self._pool(len(codes))
+        # One deadline for every shard, counted from submission so queueing is included
+        deadline = time.monotonic() + timeout
+        futures = {executor.submit(self._run, branch_engine(code), task, deadline): code for code in codes}
+        done, _ = wait(futures, timeout=timeout)
+
+        results = {}
+        statuses = {}
+        for future, code in futures.items():
+            if future not in done:
+                # The shard-side timeout interrupts the query shortly after
+                statuses[code] = {'status': 'timeout'}
+                continue
+            try:
+                results[code], elapsed = future.result()
+            except ShardTimeout:
+                statuses[code] = {'status': 'timeout'}
+            except Exception as e:
+                statuses[code] = {'status': 'error', 'message': str(e)}
+            else:
+                statuses[code] = {'status': 'ok', 'elapsed_ms': round(elapsed * 1000, 1)}
+        return results, statuses
+
+
+def merge_rows(results, sort_key=None, reverse=False):
+    """Concatenate per-branch row lists, tagging every row with its branch"""
+    rows = [dict(row, branch=code) for code, branch_rows in results.items() for row in branch_rows]
+    if sort_key is not None:
+        rows.sort(key=lambda row: row[sort_key], reverse=reverse)
+    return rows
+
+
+def merge_counts(results):
+    """Sum per-branch dicts of counters"""
+    merged = {}
+    for counts in results.values():
+        for key, value in counts.items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
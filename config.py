@@ -6,6 +6,32 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///medisync.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Branch shards: BRANCH_DATABASES="east=sqlite:///east.db,west=postgresql://..."
+    # The default branch keeps using SQLALCHEMY_DATABASE_URI, which also holds the users.
+    DEFAULT_BRANCH = os.environ.get('DEFAULT_BRANCH', 'main')
+    BRANCH_DATABASES = dict(
+        (code.strip(), uri.strip())
+        for code, uri in (entry.split('=', 1) for entry in os.environ.get('BRANCH_DATABASES', '').split(',') if '=' in entry)
+    )
+    SQLALCHEMY_BINDS = {f'branch:{code}': uri for code, uri in BRANCH_DATABASES.items()}
+    BRANCH_QUERY_TIMEOUT = float(os.environ.get('BRANCH_QUERY_TIMEOUT', 10))
+    
+    # Live dashboard feed (server-sent events)
+    EVENT_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', 100))
+    EVENT_HEARTBEAT_SECONDS = int(os.environ.get('EVENT_HEARTBEAT_SECONDS', 15))
+    
+    # Rendered invoice PDFs (defaults to <instance>/invoice_cache)
+    INVOICE_CACHE_DIR = os.environ.get('INVOICE_CACHE_DIR')
+    INVOICE_RENDER_WORKERS = int(os.environ.get('INVOICE_RENDER_WORKERS', 0)) or None
+    # Web exports are bounded; larger runs go through `flask render-invoices`
+    INVOICE_EXPORT_MAX_DAYS = int(os.environ.get('INVOICE_EXPORT_MAX_DAYS', 31))
+    INVOICE_EXPORT_MAX_INVOICES = int(os.environ.get('INVOICE_EXPORT_MAX_INVOICES', 2000))
+    
+    # Rendered table fragments, per worker process
+    FRAGMENT_CACHE_ENABLED = os.environ.get('FRAGMENT_CACHE_ENABLED', '1') != '0'
+    FRAGMENT_CACHE_MAX_ENTRIES = int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 4096))
+    FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    
     # Email configuration (optional)
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
@@ -0,0 +1,77 @@
+import json
+import queue
+import threading
+
+
+def format_sse(event, data):
+    """Serialize a payload as a server-sent event message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventBroker:
+    """In-process pub/sub that fans events out to server-sent event clients.
+
+    Every subscriber gets its own bounded queue so a slow or stalled browser
+    can never block the request that publishes. When a queue overflows the
+    pending deltas are discarded and replaced by a single ``resync`` event,
+    telling the client to refetch a fresh snapshot instead of applying a
+    partial stream of increments.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}  # subscriber queue -> channel
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel=None):
+        """Subscribe to the events published on ``channel`` (e.g. one branch)"""
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[subscriber] = channel
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.pop(subscriber, None)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event, data, channel=None):
+        message = format_sse(event, data)
+        with self._lock:
+            subscribers = [subscriber for subscriber, subscribed in self._subscribers.items() if subscribed == channel]
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                self._resync(subscriber)
+
+    def _resync(self, subscriber):
+        # Drop whatever the client has not consumed yet; the deltas are useless
+        # once one is lost, so ask it to reload a snapshot instead.
+        while True:
+            try:
+                subscriber.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            subscriber.put_nowait(format_sse('resync', {}))
+        except queue.Full:
+            pass
+
+    def stream(self, subscriber, heartbeat=15):
+        """Yield SSE messages for one subscriber, sending a heartbeat comment
+        whenever nothing was published for ``heartbeat`` seconds."""
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    yield subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': heartbeat\n\n'
+        finally:
+            self.unsubscribe(subscriber)
@@ -0,0 +1,335 @@
+import hashlib
+import hmac
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import qrcode
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+# Bump whenever the layout changes so cached PDFs are not reused
+RENDERER_VERSION = 2
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = 50
+ROW_HEIGHT = 18
+FONT = 'Helvetica'
+BOLD_FONT = 'Helvetica-Bold'
+QR_SIZE = 90
+# Space the totals block and QR code need at the end of the last page
+FOOTER_HEIGHT = 150
+# Render workers start from a fresh interpreter, never a fork of a threaded
+# server that may be holding database pool or logging locks
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def verification_code(invoice_number, final_amount, secret_key):
+    message = f"{invoice_number}|{final_amount:.2f}".encode()
+    return hmac.new(secret_key.encode(), message, hashlib.sha256).hexdigest()[:16]
+
+
+def verification_payload(invoice_number, final_amount, secret_key):
+    """Text embedded in the invoice QR code"""
+    code = verification_code(invoice_number, final_amount, secret_key)
+    return f"MEDISYNC|{invoice_number}|{final_amount:.2f}|{code}"
+
+
+def parse_verification_payload(payload):
+    """Split a scanned QR payload into (invoice_number, amount, code), or None"""
+    parts = (payload or '').split('|')
+    if len(parts) != 4 or parts[0] != 'MEDISYNC':
+        return None
+    try:
+        return parts[1], float(parts[2]), parts[3]
+    except ValueError:
+        return None
+
+
+def invoice_snapshot(sale, secret_key):
+    """Plain, picklable copy of everything printed on the invoice"""
+    final_amount = float(sale.final_amount)
+    return {
+        'sale_id': sale.id,
+        'invoice_number': sale.invoice_number,
+        'date': sale.created_at.strftime('%Y-%m-%d %H:%M'),
+        'customer_name': sale.customer_name,
+        'customer_phone': sale.customer_phone,
+        'payment_method': sale.payment_method,
+        'total_amount': float(sale.total_amount),
+        'discount': float(sale.discount or 0),
+        'tax_amount': float(sale.tax_amount or 0),
+        'final_amount': final_amount,
+        'items': [
+            {
+                'name': item.medicine.name if item.medicine else f"Medicine #{item.medicine_id}",
+                'quantity': item.quantity,
+                'unit_price': float(item.unit_price),
+                'total_price': float(item.total_price)
+            }
+            for item in sale.items
+        ],
+        'verification': verification_payload(sale.invoice_number, final_amount, secret_key)
+    }
+
+
+def _fit(text, width, font=FONT, size=10):
+    text = str(text or '')
+    if stringWidth(text, font, size) <= width:
+        return text
+    while text and stringWidth(text + '...', font, size) > width:
+        text = text[:-1]
+    return text + '...'
+
+
+def _draw_qr(pdf, payload, x, y, size):
+    qr = qrcode.QRCode(border=0, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    module = size / len(matrix)
+
+    # One rectangle per horizontal run of dark modules keeps the PDF small
+    for row_index, row in enumerate(matrix):
+        row_y = y + size - (row_index + 1) * module
+        col = 0
+        while col < len(row):
+            if not row[col]:
+                col += 1
+                continue
+            start = col
+            while col < len(row) and row[col]:
+                col += 1
+            pdf.rect(x + start * module, row_y, (col - start) * module, module, stroke=0, fill=1)
+
+
+def _draw_page_header(pdf, snapshot, page_number):
+    pdf.setFont(BOLD_FONT, 16)
+    pdf.drawString(MARGIN, PAGE_HEIGHT - MARGIN, 'MediSync')
+    pdf.setFont(FONT, 10)
+    pdf.drawRightString(PAGE_WIDTH - MARGIN, PAGE_HEIGHT - MARGIN, f"Page {page_number}")
+
+    y = PAGE_HEIGHT - MARGIN - 30
+    if page_number == 1:
+        pdf.drawString(MARGIN, y, f"Invoice: {snapshot['invoice_number']}")
+        pdf.drawString(MARGIN, y - 15, f"Date: {snapshot['date']}")
+        pdf.drawString(MARGIN, y - 30, _fit(f"Customer: {snapshot['customer_name']}", 300))
+        if snapshot['customer_phone']:
+            pdf.drawString(MARGIN, y - 45, f"Phone: {snapshot['customer_phone']}")
+        y -= 70
+    else:
+        pdf.drawString(MARGIN, y, f"Invoice: {snapshot['invoice_number']} (continued)")
+        y -= 25
+
+    pdf.setFont(BOLD_FONT, 10)
+    pdf.drawString(MARGIN, y, 'Medicine')
+    pdf.drawRightString(360, y, 'Qty')
+    pdf.drawRightString(450, y, 'Unit Price')
+    pdf.drawRightString(PAGE_WIDTH - MARGIN, y, 'Total')
+    pdf.line(MARGIN, y - 5, PAGE_WIDTH - MARGIN, y - 5)
+    pdf.setFont(FONT, 10)
+    return y - ROW_HEIGHT - 2
+
+
+def render_invoice_pdf(snapshot):
+    """Render an invoice snapshot to PDF bytes, paginating long item lists"""
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=letter)
+    pdf.setTitle(f"Invoice {snapshot['invoice_number']}")
+
+    page_number = 1
+    y = _draw_page_header(pdf, snapshot, page_number)
+
+    for item in snapshot['items']:
+        if y < MARGIN:
+            pdf.showPage()
+            page_number += 1
+            y = _draw_page_header(pdf, snapshot, page_number)
+
+        pdf.drawString(MARGIN, y, _fit(item['name'], 260))
+        pdf.drawRightString(360, y, str(item['quantity']))
+        pdf.drawRightString(450, y, f"${item['unit_price']:.2f}")
+        pdf.drawRightString(PAGE_WIDTH - MARGIN, y, f"${item['total_price']:.2f}")
+        y -= ROW_HEIGHT
+
+    if y - FOOTER_HEIGHT < MARGIN:
+        pdf.showPage()
+        page_number += 1
+        y = _draw_page_header(pdf, snapshot, page_number)
+
+    # Totals
+    pdf.line(MARGIN, y + 8, PAGE_WIDTH - MARGIN, y + 8)
+    totals = [
+        ('Subtotal', snapshot['total_amount']),
+        ('Discount', snapshot['discount']),
+        ('Tax', snapshot['tax_amount'])
+    ]
+    for label, amount in totals:
+        y -= ROW_HEIGHT
+        pdf.drawRightString(450, y, label)
+        pdf.drawRightString(PAGE_WIDTH - MARGIN, y, f"${amount:.2f}")
+    y -= ROW_HEIGHT
+    pdf.setFont(BOLD_FONT, 11)
+    pdf.drawRightString(450, y, 'Total Amount')
+    pdf.drawRightString(PAGE_WIDTH - MARGIN, y, f"${snapshot['final_amount']:.2f}")
+    pdf.setFont(FONT, 10)
+    if snapshot['payment_method']:
+        pdf.drawRightString(PAGE_WIDTH - MARGIN, y - ROW_HEIGHT, f"Paid by {snapshot['payment_method']}")
+
+    # Verification QR code, bottom-left of the totals block
+    qr_y = y - ROW_HEIGHT
+    _draw_qr(pdf, snapshot['verification'], MARGIN, qr_y, QR_SIZE)
+    pdf.setFont(FONT, 7)
+    pdf.drawString(MARGIN, qr_y - 10, 'Scan to verify this invoice')
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+class InvoiceCache:
+    """Content-addressed disk cache of rendered invoice PDFs.
+
+    The address is a hash of the sale id, the renderer version and every
+    printed field, so a changed sale or layout simply misses and stale files
+    are never served.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @staticmethod
+    def key(snapshot):
+        content = json.dumps(snapshot, sort_keys=True, separators=(',', ':'))
+        digest = hashlib.sha256(f"{RENDERER_VERSION}:{content}".encode()).hexdigest()
+        return f"{snapshot['sale_id']}-{digest[:40]}"
+
+    def path(self, snapshot):
+        key = self.key(snapshot)
+        return os.path.join(self.directory, key[-2:], f"{key}.pdf")
+
+    def render(self, snapshot):
+        """Return the path of the cached PDF, rendering it on a miss"""
+        path = self.path(snapshot)
+        if os.path.exists(path):
+            # Hits refresh the mtime, so prune() drops the least recently used first
+            os.utime(path)
+            return path
+
+        pdf_bytes = render_invoice_pdf(snapshot)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so concurrent renderers never expose a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(pdf_bytes)
+        os.replace(tmp_path, path)
+        return path
+
+    def prune(self, max_age=None, max_bytes=None):
+        """Delete PDFs unused for ``max_age`` seconds, then the least recently
+        used until the cache fits in ``max_bytes``; returns (files, bytes) removed"""
+        entries = []
+        for directory, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        cutoff = time.time() - max_age if max_age is not None else None
+        removed = freed = 0
+        for mtime, size, path in entries:
+            expired = cutoff is not None and mtime < cutoff
+            oversized = max_bytes is not None and total > max_bytes
+            if not expired and not oversized:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+            freed += size
+        return removed, freed
+
+
+def _render_into_cache(cache_directory, snapshot):
+    return InvoiceCache(cache_directory).render(snapshot)
+
+
+def process_pool(workers=None):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(START_METHOD))
+
+
+class RenderPool:
+    """Process pool that is started on first use and kept for the life of the
+    process, so web exports do not pay worker start-up on every request"""
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def map(self, fn, *iterables, chunksize=1):
+        with self._lock:
+            if self._executor is None:
+                self._executor = process_pool(self.workers)
+            executor = self._executor
+        try:
+            return list(executor.map(fn, *iterables, chunksize=chunksize))
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next call
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+
+
+def render_invoices(snapshots, cache, workers=None, pool=None):
+    """Render many invoices into the cache, fanning misses out to a process
+    pool; returns the cached paths in the same order as ``snapshots``.
+
+    ``pool`` is a long-lived ``RenderPool``; without one a pool is started for
+    this call only.
+    """
+    paths = [cache.path(snapshot) for snapshot in snapshots]
+    missing = []
+    for snapshot, path in zip(snapshots, paths):
+        try:
+            os.utime(path)  # a hit; keep it recently used
+        except FileNotFoundError:
+            missing.append(snapshot)
+
+    if len(missing) > 1 and workers != 1:
+        chunksize = max(1, len(missing) // ((workers or os.cpu_count() or 1) * 4))
+        arguments = ([cache.directory] * len(missing), missing)
+        if pool is not None:
+            pool.map(_render_into_cache, *arguments, chunksize=chunksize)
+        else:
+            with process_pool(workers) as executor:
+                list(executor.map(_render_into_cache, *arguments, chunksize=chunksize))
+    else:
+        for snapshot in missing:
+            cache.render(snapshot)
+    return paths
+
+
+def write_invoices_zip(snapshots, cache, fileobj, workers=None, pool=None):
+    paths = render_invoices(snapshots, cache, workers, pool)
+    # PDF page streams are already compressed; storing avoids a second pass
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for snapshot, path in zip(snapshots, paths):
+            archive.write(path, f"invoice_{snapshot['invoice_number']}.pdf")
+    return len(paths)
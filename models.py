@@ -1,9 +1,27 @@
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from flask_login import UserMixin
+import sqlalchemy as sa
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 
-db = SQLAlchemy()
+# Tables that live only in the default database, whichever branch is selected
+SHARED_TABLES = {'users'}
+
+class BranchSession(Session):
+    """Routes branch-owned tables to the shard named by ``session.info['branch']``"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        branch = self.info.get('branch')
+        if bind is None and branch is not None:
+            table = sa.inspect(mapper).local_table if mapper is not None else clause
+            if not (isinstance(table, sa.Table) and table.name in SHARED_TABLES):
+                engine = self._db.engines.get(f'branch:{branch}')
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={'class_': BranchSession})
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -13,6 +31,7 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128))
     role = db.Column(db.String(20), nullable=False)  # admin, pharmacist, cashier
+    branch = db.Column(db.String(50))  # None means the default branch
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime)
@@ -34,7 +53,7 @@ class User(UserMixin, db.Model):
     def can_access_module(self, module):
         """Check if user has access to specific module"""
         access_rules = {
-            'admin': ['dashboard', 'medicines', 'sales', 'prescriptions', 'suppliers', 'analytics', 'reports', 'settings'],
+            'admin': ['dashboard', 'medicines', 'sales', 'prescriptions', 'suppliers', 'analytics', 'reports', 'settings', 'headoffice'],
             'pharmacist': ['dashboard', 'medicines', 'sales', 'prescriptions', 'reports'],
             'cashier': ['dashboard', 'sales']
         }
@@ -73,6 +92,9 @@ class Supplier(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Sale(db.Model):
+    # Archiving can empty the hot table, so ids must never be handed out twice
+    __table_args__ = {'sqlite_autoincrement': True}
+    
     id = db.Column(db.Integer, primary_key=True)
     invoice_number = db.Column(db.String(50), unique=True)
     customer_name = db.Column(db.String(100))
@@ -83,12 +105,14 @@ class Sale(db.Model):
     final_amount = db.Column(db.Float, nullable=False)
     payment_method = db.Column(db.String(20))  # cash, card, upi
     cashier_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     cashier = db.relationship('User', backref=db.backref('sales', lazy=True))
     items = db.relationship('SaleItem', backref='sale', lazy=True, cascade='all, delete-orphan')
 
 class SaleItem(db.Model):
+    __table_args__ = {'sqlite_autoincrement': True}
+    
     id = db.Column(db.Integer, primary_key=True)
     sale_id = db.Column(db.Integer, db.ForeignKey('sale.id'), nullable=False)
     medicine_id = db.Column(db.Integer, db.ForeignKey('medicine.id'), nullable=False)
@@ -107,4 +131,21 @@ class Prescription(db.Model):
     prescribed_medicines = db.Column(db.Text)  # JSON string of medicines
     date_issued = db.Column(db.Date, nullable=False)
     is_fulfilled = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_versions'
+    
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SalePartition(db.Model):
+    """A closed month of sales moved out of the hot sale/sale_item tables"""
+    __tablename__ = 'sale_partitions'
+    
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    sale_count = db.Column(db.Integer, nullable=False)
+    item_count = db.Column(db.Integer, nullable=False)
+    checksum = db.Column(db.String(64), nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
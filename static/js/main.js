@@ -120,4 +120,45 @@ function clearCart() {
 // Initialize cart on page load
 document.addEventListener('DOMContentLoaded', function() {
     updateCartDisplay();
-});
\ No newline at end of file
+});
+
+// Live feed (server-sent events)
+// handlers: { sale(data), stock(data), snapshot(data) }; snapshot is called
+// after a resync or reconnect, when incremental deltas may have been missed.
+function subscribeLiveFeed(handlers) {
+    if (!window.EventSource) {
+        return null;
+    }
+
+    const source = new EventSource('/api/events/stream');
+    let connectedOnce = false;
+
+    function loadSnapshot() {
+        if (!handlers.snapshot) {
+            return;
+        }
+        fetch('/api/events/snapshot')
+            .then(response => response.json())
+            .then(handlers.snapshot)
+            .catch(error => console.error('Error loading live feed snapshot:', error));
+    }
+
+    source.addEventListener('open', function() {
+        if (connectedOnce) {
+            loadSnapshot();
+        }
+        connectedOnce = true;
+    });
+    source.addEventListener('resync', loadSnapshot);
+
+    ['sale', 'stock'].forEach(eventName => {
+        source.addEventListener(eventName, function(e) {
+            if (handlers[eventName]) {
+                handlers[eventName](JSON.parse(e.data));
+            }
+        });
+    });
+
+    window.addEventListener('beforeunload', () => source.close());
+    return source;
+}
@@ -0,0 +1,12 @@
+/** @type {import('tailwindcss').Config} */
+module.exports = {
+  // Only classes that appear in these files end up in the built bundle
+  content: [
+    './templates/**/*.html',
+    './static/js/**/*.js'
+  ],
+  theme: {
+    extend: {}
+  },
+  plugins: []
+}
@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its configuration and creates its tables at import time, so
+# point it at throwaway SQLite files before anything imports it
+_database_dir = tempfile.mkdtemp(prefix='medisync-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_database_dir, 'main.db')}"
+os.environ['INVOICE_CACHE_DIR'] = os.path.join(_database_dir, 'invoice_cache')
+os.environ['BRANCH_DATABASES'] = ','.join(
+    f"{code}=sqlite:///{os.path.join(_database_dir, f'{code}.db')}" for code in ('north', 'south')
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+
+from app import app as flask_app  # noqa: E402
+from archive import archive_tables  # noqa: E402
+from branches import branch_codes  # noqa: E402
+from models import db, Medicine, Sale, SaleItem, SalePartition  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        yield flask_app
+        db.session.rollback()
+        # Every test starts from empty sales tables on every shard
+        for branch in branch_codes():
+            db.session.info['branch'] = branch
+            connection = db.session.connection()
+            for month in db.session.scalars(select(SalePartition.month)).all():
+                for table in reversed(archive_tables(month)):
+                    table.drop(connection, checkfirst=True)
+            for model in (SaleItem, Sale, SalePartition, Medicine):
+                db.session.query(model).delete()
+            db.session.commit()
+        db.session.info['branch'] = flask_app.config['DEFAULT_BRANCH']
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    return client
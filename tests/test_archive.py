@@ -0,0 +1,121 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import inspect, update
+
+import archive
+from app import invoice_snapshots, sales_report_rows
+from invoices import verification_payload
+from models import db, Medicine, Sale, SaleItem, SalePartition
+
+MONTH = '2025-01'
+
+
+def add_sale(invoice_number, created_at, amount=10.0, items=2):
+    medicine = Medicine.query.filter_by(name='Paracetamol').first()
+    if medicine is None:
+        medicine = Medicine(name='Paracetamol', quantity=100, price=2.5, expiry_date=date(2030, 1, 1))
+        db.session.add(medicine)
+        db.session.flush()
+
+    sale = Sale(invoice_number=invoice_number, customer_name='Walk-in Customer', total_amount=amount,
+                final_amount=amount, payment_method='cash', created_at=created_at)
+    db.session.add(sale)
+    db.session.flush()
+    for _ in range(items):
+        db.session.add(SaleItem(sale_id=sale.id, medicine_id=medicine.id, quantity=1,
+                                unit_price=amount / items, total_price=amount / items))
+    db.session.commit()
+    return sale
+
+
+@pytest.fixture
+def january(app):
+    """Two sales in a closed month and one in the current month"""
+    add_sale('INV-JAN-1', datetime(2025, 1, 5, 10), amount=10.0, items=2)
+    add_sale('INV-JAN-2', datetime(2025, 1, 20, 15), amount=30.0, items=3)
+    add_sale('INV-NOW-1', datetime.utcnow(), amount=5.0, items=1)
+
+
+def test_archive_moves_month_out_of_hot_tables(january):
+    partition = archive.archive_month(MONTH)
+
+    assert (partition.sale_count, partition.item_count) == (2, 5)
+    assert [sale.invoice_number for sale in Sale.query.all()] == ['INV-NOW-1']
+    assert SaleItem.query.count() == 1
+    assert archive.verify_month(MONTH)
+
+
+def test_reports_read_archived_partitions(january):
+    archive.archive_month(MONTH)
+
+    start, end = archive.month_bounds(MONTH)
+    january_rows = archive.sales_in_range(start, end)
+    assert [(row.invoice_number, row.item_count) for row in january_rows] == [('INV-JAN-2', 3), ('INV-JAN-1', 2)]
+    assert {row['invoice_number'] for row in sales_report_rows()} == {'INV-JAN-1', 'INV-JAN-2', 'INV-NOW-1'}
+
+    totals = archive.daily_sales_totals(start, end)
+    assert totals == {'2025-01-05': (1, 10.0), '2025-01-20': (1, 30.0)}
+
+
+def test_only_overlapping_partitions_are_read(january):
+    archive.archive_month(MONTH)
+
+    start, end = archive.month_bounds('2025-03')
+    assert archive.sale_partitions(start, end) == [(Sale.__table__, SaleItem.__table__)]
+    assert len(archive.sale_partitions()) == 2
+
+
+def test_archived_invoices_export_and_verify(january, client, app):
+    archive.archive_month(MONTH)
+
+    snapshots = invoice_snapshots('2025-01-01', '2025-01-31')
+    assert [snapshot['invoice_number'] for snapshot in snapshots] == ['INV-JAN-1', 'INV-JAN-2']
+    assert [len(snapshot['items']) for snapshot in snapshots] == [2, 3]
+
+    payload = verification_payload('INV-JAN-2', 30.0, app.config['SECRET_KEY'])
+    assert client.get('/invoices/verify', query_string={'payload': payload}).get_json()['valid']
+
+
+def test_restore_moves_month_back(january):
+    archive.archive_month(MONTH)
+    archive.restore_month(MONTH)
+
+    assert Sale.query.count() == 3
+    assert SaleItem.query.count() == 6
+    assert db.session.get(SalePartition, MONTH) is None
+    sale_table, _ = archive.archive_tables(MONTH)
+    assert not inspect(db.session.connection()).has_table(sale_table.name)
+
+
+def test_checksum_mismatch_is_detected(january):
+    archive.archive_month(MONTH)
+    sale_table, _ = archive.archive_tables(MONTH)
+    db.session.execute(
+        update(sale_table).where(sale_table.c.invoice_number == 'INV-JAN-1').values(final_amount=99.0)
+    )
+    db.session.commit()
+
+    assert not archive.verify_month(MONTH)
+    with pytest.raises(ValueError, match='does not match'):
+        archive.restore_month(MONTH)
+    # The failed restore leaves the archive in place
+    assert Sale.query.count() == 1
+    assert db.session.get(SalePartition, MONTH) is not None
+
+
+def test_open_month_cannot_be_archived(january):
+    with pytest.raises(ValueError, match='not a closed month'):
+        archive.archive_month(archive.month_key(datetime.utcnow()))
+
+
+def test_ids_are_not_reused_after_archiving_empties_the_hot_table(app):
+    archived_id = add_sale('INV-OLD-1', datetime(2025, 1, 10)).id
+    archive.archive_month(MONTH)
+    assert Sale.query.count() == 0
+
+    new_sale = add_sale('INV-NEW-1', datetime.utcnow())
+    assert new_sale.id > archived_id
+
+    archive.restore_month(MONTH)
+    assert Sale.query.count() == 2
@@ -0,0 +1,92 @@
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from app import sales_report_rows
+from branches import BranchAggregator, branch_codes, merge_rows
+from models import db, Sale
+
+# Counts forever, so only the shard-side timeout can stop it
+ENDLESS_QUERY = 'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c'
+
+
+def add_branch_sale(branch, invoice_number, amount):
+    db.session.info['branch'] = branch
+    db.session.add(Sale(invoice_number=invoice_number, customer_name='Walk-in Customer', total_amount=amount,
+                        final_amount=amount, payment_method='cash', created_at=datetime.utcnow()))
+    db.session.commit()
+
+
+@pytest.fixture
+def branch_sales(app):
+    add_branch_sale('north', 'INV-N-1', 10.0)
+    add_branch_sale('south', 'INV-S-1', 20.0)
+    add_branch_sale('south', 'INV-S-2', 30.0)
+    db.session.info['branch'] = app.config['DEFAULT_BRANCH']
+
+
+def test_shards_are_configured(app):
+    assert branch_codes() == ['main', 'north', 'south']
+
+
+def test_aggregates_every_shard(branch_sales):
+    results, statuses = BranchAggregator().run(lambda session: sales_report_rows(session=session), timeout=5)
+
+    assert {code: status['status'] for code, status in statuses.items()} == {
+        'main': 'ok', 'north': 'ok', 'south': 'ok'
+    }
+    rows = merge_rows(results, 'total_amount')
+    assert [(row['branch'], row['invoice_number']) for row in rows] == [
+        ('north', 'INV-N-1'), ('south', 'INV-S-1'), ('south', 'INV-S-2')
+    ]
+
+
+def test_failed_and_hung_shards_are_reported(branch_sales):
+    # Tasks run on pool threads without an app context, so resolve the engines here
+    north, south = db.engines['branch:north'], db.engines['branch:south']
+
+    def failing_and_hanging_task(session):
+        if session.bind is north:
+            raise RuntimeError('north is down')
+        if session.bind is south:
+            return session.execute(text(ENDLESS_QUERY)).scalar()
+        return sales_report_rows(session=session)
+
+    aggregator = BranchAggregator(calls_per_branch=1)
+
+    started = time.monotonic()
+    results, statuses = aggregator.run(failing_and_hanging_task, timeout=0.5)
+    assert time.monotonic() - started < 2
+
+    assert statuses['main']['status'] == 'ok'
+    assert statuses['north'] == {'status': 'error', 'message': 'north is down'}
+    assert statuses['south'] == {'status': 'timeout'}
+    assert list(results) == ['main']
+
+    # The hung query was interrupted on the shard, so a single-thread-per-branch
+    # pool still answers the next call on every branch
+    results, statuses = aggregator.run(lambda session: sales_report_rows(session=session), timeout=5)
+    assert {status['status'] for status in statuses.values()} == {'ok'}
+    assert len(results['south']) == 2
+
+
+def test_headoffice_report_flags_partial_results(branch_sales, client, app, monkeypatch):
+    response = client.get('/api/headoffice/sales-report').get_json()
+    assert not response['partial']
+    assert sorted(row['invoice_number'] for row in response['data']) == ['INV-N-1', 'INV-S-1', 'INV-S-2']
+
+    south = db.engines['branch:south']
+
+    def broken_south(start, end, session):
+        if session.bind is south:
+            raise RuntimeError('south is down')
+        return []
+
+    monkeypatch.setattr('app.sales_report_rows', broken_south)
+    response = client.get('/api/headoffice/sales-report').get_json()
+    assert response['partial']
+    assert {code: status['status'] for code, status in response['branches'].items()} == {
+        'main': 'ok', 'north': 'ok', 'south': 'error'
+    }
@@ -0,0 +1,89 @@
+import hashlib
+import itertools
+from datetime import date
+from functools import wraps
+
+from flask import Response, make_response, request
+from flask_login import current_user
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from models import db, DataVersion
+
+VERSION_TABLE = DataVersion.__tablename__
+
+
+def tracked_tables():
+    return [name for name in db.metadata.tables if name != VERSION_TABLE]
+
+
+def seed_data_versions():
+    """Make sure every tracked table has a version row, so bumps are plain UPDATEs"""
+    existing = set(db.session.scalars(select(DataVersion.table_name)))
+    for table_name in tracked_tables():
+        if table_name not in existing:
+            db.session.add(DataVersion(table_name=table_name, version=0))
+    db.session.commit()
+
+
+def bump_data_version(connection, *tables):
+    """Bump the version of each table; for writes that bypass the ORM unit of work"""
+    if tables:
+        connection.execute(
+            update(DataVersion.__table__)
+            .where(DataVersion.__table__.c.table_name.in_(tables))
+            .values(version=DataVersion.__table__.c.version + 1)
+        )
+
+
+def get_data_versions(*tables):
+    """Current version of each table, read with one Core query (no ORM identity map)"""
+    rows = db.session.execute(
+        select(DataVersion.__table__.c.table_name, DataVersion.__table__.c.version)
+        .where(DataVersion.__table__.c.table_name.in_(tables))
+    ).all()
+    versions = dict(rows)
+    return tuple(versions.get(table_name, 0) for table_name in tables)
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_flushed_tables(session, flush_context):
+    # The UPDATE runs inside the flushing transaction, so a rollback undoes it
+    # and every process sharing the database sees the same versions.
+    tables = {
+        obj.__table__.name
+        for obj in itertools.chain(session.new, session.dirty, session.deleted)
+        if obj.__table__.name != VERSION_TABLE
+    }
+    bump_data_version(session.connection(), *sorted(tables))
+
+
+def conditional(*tables, daily=False):
+    """Serve a view with a strong ETag derived from the data versions of
+    ``tables`` and answer a matching ``If-None-Match`` with 304 before the view
+    runs. Views whose output depends on today's date pass ``daily=True``."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = [
+                request.endpoint,
+                request.query_string.decode(),
+                current_user.role,
+                str(db.session.info.get('branch')),
+                *map(str, get_data_versions(*tables))
+            ]
+            if daily:
+                key.append(date.today().isoformat())
+            etag = hashlib.sha256('|'.join(key).encode()).hexdigest()[:32]
+
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator